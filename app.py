@@ -2,20 +2,32 @@
 from flask import Flask, jsonify, render_template, redirect, url_for, flash, request
 from flask_login import LoginManager, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Customer, MilkType, RateChart, Transaction, Bill
+from models import db, User, Customer, MilkType, RateChart, RateChartVersion, Transaction, Bill
+from rates import RateEngine, lookup_rate, publish_rate_version
+from repricing import reprice_transactions
+from customer_search import ensure_customer_index, search_customers
+from http_cache import init_http_cache
+from audit_log import init_audit_log, write_snapshot, replay, write_restored_db
 from auth import auth
 from billing import billing
 from datetime import datetime, date, time, timezone
 import os
+import json
+import click
 from zoneinfo import ZoneInfo
 
 IST = ZoneInfo("Asia/Kolkata")
 
-def create_app():
+# customers rendered up front; the rest are reached through /customers/search
+CUSTOMER_PAGE_SIZE = 50
+
+def create_app(config=None):
     app = Flask(__name__, static_folder="static", template_folder="templates")
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "replace-with-a-strong-secret")
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///db.sqlite3"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if config:
+        app.config.update(config)
 
     db.init_app(app)
 
@@ -25,6 +37,7 @@ def create_app():
 
     app.register_blueprint(auth)
     app.register_blueprint(billing)
+    init_http_cache(app)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -58,8 +71,22 @@ def create_app():
         if current_user.role != "admin":
             flash("Not authorized", "error")
             return redirect(url_for("dashboard"))
-        customers = Customer.query.order_by(Customer.name).all()
-        return render_template("customers.html", customers=customers)
+        customers = Customer.query.order_by(Customer.name).limit(CUSTOMER_PAGE_SIZE).all()
+        total_customers = Customer.query.count()
+        return render_template("customers.html", customers=customers,
+                               total_customers=total_customers)
+
+    @app.route("/customers/search")
+    @login_required
+    def customers_search():
+        # type-ahead lookup by name, phone or ID for the customer pickers
+        if current_user.role != "admin":
+            return jsonify({"error": "Permission denied."}), 403
+        try:
+            limit = max(1, min(int(request.args.get("limit", 20)), 100))
+        except ValueError:
+            limit = 20
+        return jsonify({"results": search_customers(request.args.get("q", ""), limit=limit)}), 200
 
     @app.route("/customers/new", methods=["POST"])
     @login_required
@@ -89,15 +116,21 @@ def create_app():
             txns = Transaction.query.order_by(Transaction.date_time.desc()).limit(300).all()
         return render_template("transactions.html", txns=txns)
 
-    def lookup_rate(milk_type_id, fat_value):
-        # prefer exact fat value in RateChart, else MilkType.default_rate
-        if fat_value is not None:
-            rc = RateChart.query.filter_by(milk_type_id=milk_type_id, fat_value=fat_value).first()
-            if rc:
-                return rc.rate
-        mt = MilkType.query.get(milk_type_id)
-        return mt.default_rate if mt else 0.0
-    
+    def chart_rows_on(milk_type_id, on):
+        # rows of the chart version in effect on `on`, else the original undated chart
+        version = (RateChartVersion.query
+                   .filter(RateChartVersion.milk_type_id == milk_type_id,
+                           RateChartVersion.effective_from <= on)
+                   .order_by(RateChartVersion.effective_from.desc(), RateChartVersion.id.desc())
+                   .first())
+        if version:
+            return version, version.entries
+        rows = (RateChart.query
+                .filter_by(milk_type_id=milk_type_id)
+                .order_by(RateChart.fat_value)
+                .all())
+        return None, rows
+
     @app.route("/rate-chart")
     @login_required
     def rate_chart_view():
@@ -110,25 +143,95 @@ def create_app():
             flash("Milk types not found. Please run init-db.", "error")
             return redirect(url_for("dashboard"))
 
-        # query rate chart by fat values
-        cow_rates = (RateChart.query
-                    .filter_by(milk_type_id=cow.id)
-                    .order_by(RateChart.fat_value)
-                    .all())
-        buff_rates = (RateChart.query
-                    .filter_by(milk_type_id=buff.id)
-                    .order_by(RateChart.fat_value)
-                    .all())
+        # chart in effect on ?on=YYYY-MM-DD (IST), default today
+        on = datetime.now(IST).date()
+        on_str = request.args.get("on")
+        if on_str:
+            try:
+                on = datetime.strptime(on_str, "%Y-%m-%d").date()
+            except ValueError:
+                flash("Invalid date format. Use YYYY-MM-DD.", "error")
+
+        cow_version, cow_rates = chart_rows_on(cow.id, on)
+        buff_version, buff_rates = chart_rows_on(buff.id, on)
 
         return render_template(
             "rate_chart.html",
             cow_rates=cow_rates,
             buff_rates=buff_rates,
+            cow_version=cow_version,
+            buff_version=buff_version,
+            on=on,
             cow=cow,
             buff=buff,
             title="Rate Chart"
         )
+
+    @app.route("/rate-chart/versions", methods=["POST"])
+    @login_required
+    def publish_rate_chart():
+        # publish a new effective-dated chart version; existing versions are never edited
+        if current_user.role != "admin":
+            return jsonify({"error": "Only admin can change rates."}), 403
+
+        if not request.is_json:
+            return jsonify({"error": "Expected JSON payload."}), 400
+
+        payload = request.get_json()
+        if not isinstance(payload, dict):
+            return jsonify({"error": "Expected a JSON object."}), 400
+        try:
+            milk_type_id = int(payload.get("milk_type_id"))
+            effective_from = datetime.strptime(payload.get("effective_from") or "", "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return jsonify({"error": "milk_type_id and effective_from (YYYY-MM-DD) are required."}), 400
+
+        try:
+            version = publish_rate_version(milk_type_id, effective_from,
+                                           payload.get("entries"), note=payload.get("note"))
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": "DB commit failed", "details": str(e)}), 500
+
+        return jsonify({"message": f"Rate chart version {version.id} published.",
+                        "version_id": version.id,
+                        "effective_from": version.effective_from.isoformat()}), 200
     
+    @app.route("/transactions/reprice", methods=["POST"])
+    @login_required
+    def reprice():
+        # re-apply effective-dated rates to a date range; dry run unless "dry_run": false
+        if current_user.role != "admin":
+            return jsonify({"error": "Only admin can re-price transactions."}), 403
+
+        if not request.is_json:
+            return jsonify({"error": "Expected JSON payload."}), 400
+
+        payload = request.get_json()
+        if not isinstance(payload, dict):
+            return jsonify({"error": "Expected a JSON object."}), 400
+        try:
+            start = datetime.strptime(payload.get("start_date") or "", "%Y-%m-%d").date()
+            end = datetime.strptime(payload.get("end_date") or "", "%Y-%m-%d").date()
+            mt_raw = payload.get("milk_type_id")
+            milk_type_id = int(mt_raw) if mt_raw not in (None, "") else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "start_date and end_date (YYYY-MM-DD) are required."}), 400
+        dry_run = payload.get("dry_run", True) is not False
+
+        try:
+            report = reprice_transactions(start, end, milk_type_id=milk_type_id, dry_run=dry_run)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": "Re-pricing failed", "details": str(e)}), 500
+
+        return jsonify(report), 200
+
     # New route: accept batch JSON
     @app.route("/transactions/batch", methods=["POST"])
     @login_required
@@ -146,6 +249,7 @@ def create_app():
 
         saved = 0
         errors = []
+        rates = RateEngine()
         for idx, t in enumerate(txns):
             # required fields: customer_id, milk_type_id, txn_date, qty_liters
             try:
@@ -179,9 +283,9 @@ def create_app():
                 errors.append({"index": idx, "error": "Invalid date format."})
                 continue
 
-            # lookup rate (implement or reuse your lookup_rate)
+            # lookup rate from the chart version in effect on the IST date
             try:
-                rate = lookup_rate(milk_type_id, fat_value)
+                rate = rates.lookup(milk_type_id, fat_value, on=ist_dt.date())
             except Exception as e:
                 errors.append({"index": idx, "error": f"Rate lookup failed: {str(e)}"})
                 continue
@@ -219,7 +323,6 @@ def create_app():
             return redirect(url_for("transactions"))
 
         milk_types = MilkType.query.order_by(MilkType.name).all()
-        customers = Customer.query.order_by(Customer.name).all()
 
         if request.method == "POST":
             # --- parse/validate incoming form data ---
@@ -269,7 +372,7 @@ def create_app():
                 return redirect(url_for("new_transaction"))
 
             # --- compute rate & total ---
-            rate = lookup_rate(milk_type_id, fat_value)
+            rate = lookup_rate(milk_type_id, fat_value, on=ist_dt.date())
             total = round(qty * rate, 2)
 
             # --- create transaction object (store UTC-naive datetime into date_time) ---
@@ -295,7 +398,6 @@ def create_app():
         return render_template(
             "new_transaction.html",
             milk_types=milk_types,
-            customers=customers,
             today=today_ist
         )
     
@@ -408,9 +510,57 @@ def create_app():
             db.session.commit()
             print("DB initialized and seeded.")
 
+    @app.cli.command("reprice")
+    @click.argument("start_date", type=click.DateTime(["%Y-%m-%d"]), metavar="START_DATE")
+    @click.argument("end_date", type=click.DateTime(["%Y-%m-%d"]), metavar="END_DATE")
+    @click.option("--milk-type", "milk_type_id", type=int, default=None, help="Only this milk type id.")
+    @click.option("--apply", "apply_changes", is_flag=True, help="Write changes (default is a dry run).")
+    def reprice_cli(start_date, end_date, milk_type_id, apply_changes):
+        """Re-price transactions between START_DATE and END_DATE (YYYY-MM-DD, IST)."""
+        with app.app_context():
+            try:
+                report = reprice_transactions(start_date.date(), end_date.date(),
+                                              milk_type_id=milk_type_id, dry_run=not apply_changes)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        print(json.dumps(report, indent=2))
+
+    @app.cli.command("audit-snapshot")
+    def audit_snapshot():
+        """Write a full snapshot of customers, transactions and bills to the audit log."""
+        with app.app_context():
+            print("Snapshot written:", write_snapshot(app.config["AUDIT_LOG_DIR"]))
+
+    @app.cli.command("audit-replay")
+    @click.argument("at", metavar="AT", type=click.DateTime(
+        ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M"]))
+    @click.option("--out", "out_path", default=None, help="Output SQLite file.")
+    def audit_replay(at, out_path):
+        """Rebuild the database as it was at AT (IST, e.g. "2026-10-19 14:30:15").
+
+        Writes a copy of the live database whose customers, transactions and
+        bills are replayed from the audit log; the live database is untouched.
+        """
+        at_ist = at.replace(tzinfo=IST)
+        at_utc = at_ist.astimezone(timezone.utc).replace(tzinfo=None)
+        with app.app_context():
+            try:
+                state, stats = replay(app.config["AUDIT_LOG_DIR"], at_utc)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            live_path = db.engine.url.database
+            if out_path is None:
+                out_path = os.path.join(app.instance_path,
+                                        f"db-restored-{at_ist.strftime('%Y%m%dT%H%M%S')}.sqlite3")
+            write_restored_db(live_path, out_path, state)
+        print(json.dumps(stats, indent=2))
+        print("Restored database written to", out_path)
+
     # create tables automatically if file missing
     with app.app_context():
         db.create_all()
+        ensure_customer_index()
+        init_audit_log(app)
 
     return app
 
@@ -0,0 +1,294 @@
+# audit_log.py
+"""Append-only change log for Transaction, Customer and Bill.
+
+Every committed insert, update and delete on the tracked tables is appended
+as one JSON line to a daily segment file (changes-YYYYMMDD-<pid>.jsonl) in the
+audit directory. Records are handed to a background writer thread, which
+appends them in batches, so requests never wait on the disk.
+
+Snapshot files (snapshot-<timestamp>.jsonl) hold a full copy of the tracked
+tables. replay() loads the newest snapshot at or before a timestamp and
+applies only the log records after it, which is much faster than restoring
+and re-entering a whole backup.
+"""
+import atexit
+import glob
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import Session
+from models import Transaction, Customer, Bill
+
+TRACKED = {m.__tablename__: m for m in (Customer, Transaction, Bill)}
+# restore order respects foreign keys (bill/transaction -> customer)
+RESTORE_ORDER = ["customer", "transaction", "bill"]
+
+FLUSH_INTERVAL_SECONDS = 1.0
+BATCH_SIZE = 500
+# longest a process waits at exit for queued records to reach the disk
+DRAIN_TIMEOUT_SECONDS = 10.0
+
+log = logging.getLogger(__name__)
+
+_writer = None
+_seq = itertools.count()
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row_of(obj):
+    # only loaded attributes, so serializing a deleted object never triggers a lazy load
+    loaded = inspect(obj).dict
+    return {c.key: _encode(loaded[c.key]) for c in inspect(type(obj)).column_attrs if c.key in loaded}
+
+
+def _decode_row(table, row):
+    model = TRACKED[table]
+    out = {}
+    for c in inspect(model).column_attrs:
+        if c.key not in row:
+            continue
+        value = row[c.key]
+        python_type = c.columns[0].type.python_type
+        if value is not None and python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif value is not None and python_type is date:
+            value = date.fromisoformat(value)
+        out[c.key] = value
+    return out
+
+
+class _SegmentWriter(threading.Thread):
+    def __init__(self, directory, records=None):
+        super().__init__(name="audit-log-writer", daemon=True)
+        self.directory = directory
+        self.queue = records if records is not None else queue.Queue()
+        self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get(timeout=FLUSH_INTERVAL_SECONDS))
+            except queue.Empty:
+                pass
+            try:
+                self.write(batch)
+            except Exception:
+                # disk full, permissions...: report it and keep serving later batches
+                log.exception("Audit log: failed to write %d change records to %s",
+                              len(batch), self.directory)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, batch):
+        by_day = {}
+        for record in batch:
+            try:
+                line = json.dumps(record, separators=(",", ":")) + "\n"
+            except (TypeError, ValueError):
+                log.exception("Audit log: dropping unserializable %s record for %s",
+                              record["op"], record["table"])
+                continue
+            by_day.setdefault(record["ts"][:10].replace("-", ""), []).append(line)
+        for day, lines in by_day.items():
+            path = os.path.join(self.directory, f"changes-{day}-{self.pid}.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def drain(self, timeout=DRAIN_TIMEOUT_SECONDS):
+        """Wait until queued records are written; False if that did not happen in time."""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.is_alive():
+                    log.error("Audit log: %d change records were not written",
+                              self.queue.unfinished_tasks)
+                    return False
+                # wake up now and then so a writer that died is noticed
+                self.queue.all_tasks_done.wait(min(remaining, FLUSH_INTERVAL_SECONDS))
+        return True
+
+
+def _start_writer(directory, records=None):
+    global _writer
+    _writer = _SegmentWriter(directory, records)
+    _writer.start()
+    atexit.register(_writer.drain)
+    return _writer
+
+
+def init_audit_log(app):
+    """Start the background writer and make sure a baseline snapshot exists."""
+    if not app.config.get("AUDIT_LOG_ENABLED", True):
+        return
+    directory = app.config.get("AUDIT_LOG_DIR") or os.path.join(app.instance_path, "audit")
+    os.makedirs(directory, exist_ok=True)
+    app.config["AUDIT_LOG_DIR"] = directory
+    if _writer is None or _writer.directory != directory:
+        _start_writer(directory)
+    if not glob.glob(os.path.join(directory, "snapshot-*.jsonl")):
+        # replay needs a starting state; take one the first time logging is enabled
+        write_snapshot(directory)
+
+
+def stage_bulk_updates(session, table, rows):
+    # bulk UPDATEs bypass flush events; stage their partial rows for the same commit
+    pending = session.info.setdefault("audit_pending", [])
+    pending.extend(("update", table, dict(r)) for r in rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    if _writer is None:
+        return
+    pending = session.info.setdefault("audit_pending", [])
+    for obj in session.new:
+        if type(obj) in TRACKED.values():
+            pending.append(("insert", type(obj).__tablename__, _row_of(obj)))
+    for obj in session.dirty:
+        if type(obj) in TRACKED.values() and session.is_modified(obj, include_collections=False):
+            pending.append(("update", type(obj).__tablename__, _row_of(obj)))
+    for obj in session.deleted:
+        if type(obj) in TRACKED.values():
+            pending.append(("delete", type(obj).__tablename__, _row_of(obj)))
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_changes(session):
+    pending = session.info.pop("audit_pending", None)
+    if not pending or _writer is None:
+        return
+    writer = _writer
+    if writer.pid != os.getpid():
+        # forked worker (e.g. gunicorn --preload): threads do not survive a fork
+        writer = _start_writer(writer.directory)
+    elif not writer.is_alive():
+        # never leave records on a queue nobody reads; the new thread takes over the backlog
+        log.error("Audit log writer thread died; restarting it")
+        writer = _start_writer(writer.directory, writer.queue)
+    ts = datetime.utcnow().isoformat()
+    for op, table, row in pending:
+        writer.queue.put({"ts": ts, "seq": next(_seq), "pid": writer.pid,
+                          "op": op, "table": table, "row": row})
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("audit_pending", None)
+
+
+def write_snapshot(directory):
+    """Dump the tracked tables to a new snapshot file and return its path."""
+    taken_at = datetime.utcnow()
+    path = os.path.join(directory, f"snapshot-{taken_at.strftime('%Y%m%dT%H%M%S%f')}.jsonl")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"snapshot_at": taken_at.isoformat()}) + "\n")
+        for table in RESTORE_ORDER:
+            for obj in TRACKED[table].query.yield_per(1000):
+                f.write(json.dumps({"table": table, "row": _row_of(obj)}, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)   # a half-written snapshot is never picked up
+    return path
+
+
+def _snapshot_before(directory, at):
+    best = None
+    for path in sorted(glob.glob(os.path.join(directory, "snapshot-*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            taken_at = datetime.fromisoformat(json.loads(f.readline())["snapshot_at"])
+        if taken_at <= at:
+            best = (path, taken_at)
+    return best
+
+
+def replay(directory, at):
+    """State of the tracked tables at UTC-naive datetime `at`.
+
+    Returns (state, stats) where state is {table: {id: row}}.
+    """
+    found = _snapshot_before(directory, at)
+    if found is None:
+        raise ValueError("No snapshot at or before that time; nothing to replay from.")
+    path, taken_at = found
+    state = {table: {} for table in TRACKED}
+    with open(path, encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            rec = json.loads(line)
+            state[rec["table"]][rec["row"]["id"]] = rec["row"]
+
+    # segment names carry the UTC day, so only the days in (snapshot, at] are read
+    first_day, last_day = taken_at.strftime("%Y%m%d"), at.strftime("%Y%m%d")
+    records = []
+    for seg in glob.glob(os.path.join(directory, "changes-*.jsonl")):
+        day = os.path.basename(seg).split("-")[1]
+        if not first_day <= day <= last_day:
+            continue
+        with open(seg, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break   # torn final write; ignore the partial record
+                rec = json.loads(line)
+                ts = datetime.fromisoformat(rec["ts"])
+                if taken_at < ts <= at:
+                    records.append((ts, rec["pid"], rec["seq"], rec))
+    records.sort(key=lambda r: r[:3])
+
+    for _, _, _, rec in records:
+        rows = state[rec["table"]]
+        row_id = rec["row"]["id"]
+        if rec["op"] == "delete":
+            rows.pop(row_id, None)
+        elif rec["op"] == "insert":
+            rows[row_id] = dict(rec["row"])
+        else:
+            rows.setdefault(row_id, {}).update(rec["row"])
+
+    stats = {"snapshot": os.path.basename(path), "snapshot_at": taken_at.isoformat(),
+             "applied": len(records),
+             **{table: len(rows) for table, rows in state.items()}}
+    return state, stats
+
+
+def write_restored_db(live_db_path, out_path, state):
+    """Copy the live database to out_path and replace the tracked tables with `state`."""
+    src = sqlite3.connect(live_db_path)
+    dst = sqlite3.connect(out_path)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    engine = create_engine(f"sqlite:///{out_path}")
+    try:
+        with engine.begin() as conn:
+            # the copied search index no longer matches; startup rebuilds it
+            conn.exec_driver_sql("DROP TABLE IF EXISTS customer_fts")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS customer_fts_state")
+            for table in reversed(RESTORE_ORDER):
+                conn.execute(TRACKED[table].__table__.delete())
+            for table in RESTORE_ORDER:
+                rows = [_decode_row(table, r) for r in state[table].values()]
+                if rows:
+                    conn.execute(TRACKED[table].__table__.insert(), rows)
+    finally:
+        engine.dispose()
@@ -0,0 +1,106 @@
+# bench_pages.py
+"""Bytes on the wire and server render time for the main pages.
+
+Runs against a throwaway SQLite database seeded with synthetic data, so the
+real instance/db.sqlite3 is never touched:
+
+    python bench_pages.py [--customers 2000] [--days 30] [--runs 20]
+
+For each page it reports the uncompressed size, the gzip/brotli size actually
+sent, the size of a revalidation (304), the median server time, and the
+estimated transfer time on 2G and 3G links.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+
+# effective downlink throughput, bytes per second
+LINKS = {"2G": 50_000 / 8, "3G": 400_000 / 8}
+
+
+def seed(app, customers, days):
+    from models import db, User, Customer, MilkType, RateChart, Transaction, Bill
+    with app.app_context():
+        db.session.add(User(phone="admin", name="Bench", role="admin",
+                            password_hash=generate_password_hash("bench")))
+        cow = MilkType(name="Cow", default_rate=45.0)
+        buff = MilkType(name="Buffalo", default_rate=60.0)
+        db.session.add_all([cow, buff])
+        db.session.commit()
+        for fat in range(1, 11):
+            db.session.add(RateChart(milk_type_id=cow.id, fat_value=fat, rate=30 + fat * 2))
+            db.session.add(RateChart(milk_type_id=buff.id, fat_value=fat, rate=50 + fat * 2.5))
+        custs = [Customer(name=f"Farmer {i:05d}", phone=f"98{i:08d}") for i in range(customers)]
+        db.session.add_all(custs)
+        db.session.commit()
+        start = datetime.utcnow() - timedelta(days=days)
+        txns = []
+        for c in custs[:200]:
+            for d in range(days):
+                for session in ("Morning", "Evening"):
+                    txns.append(Transaction(customer_id=c.id, milk_type_id=cow.id,
+                                            date_time=start + timedelta(days=d), session=session,
+                                            qty_liters=2.5, fat_value=4.0, rate_applied=38.0,
+                                            total_amount=95.0, txn_type="Sell"))
+        db.session.add_all(txns)
+        week_start = (start + timedelta(days=1)).date()
+        db.session.add(Bill(customer_id=custs[0].id, week_start=week_start,
+                            week_end=week_start + timedelta(days=6), total_amount=1330.0))
+        db.session.commit()
+
+
+def measure(client, path, encoding, runs):
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    timings = []
+    resp = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        resp = client.get(path, headers=headers)
+        timings.append(time.perf_counter() - t0)
+    size = len(resp.get_data())
+    etag = resp.headers.get("ETag")
+    not_modified = None
+    if etag:
+        revalidate = client.get(path, headers={**headers, "If-None-Match": etag})
+        if revalidate.status_code == 304:
+            not_modified = len(revalidate.get_data())
+    return resp.status_code, size, statistics.median(timings), not_modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    from app import create_app
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(tmp, "bench.sqlite3"),
+                          "AUDIT_LOG_ENABLED": False})
+        seed(app, args.customers, args.days)
+
+        client = app.test_client()
+        client.post("/auth/login", data={"phone": "admin", "password": "bench"})
+        pages = ["/", "/customers", "/transactions", "/transactions/new", "/rate-chart", "/bills",
+                 "/bill/1", "/customers/search?q=farmer%2000", "/static/css/base.css"]
+
+        header = f"{'page':34} {'status':>6} {'raw B':>8} {'gzip B':>8} {'br B':>8} {'304 B':>6} {'ms':>7}"
+        header += "".join(f" {name + ' s':>7}" for name in LINKS)
+        print(header)
+        for path in pages:
+            status, raw, t_raw, _ = measure(client, path, None, args.runs)
+            _, gz, _, not_mod = measure(client, path, "gzip", 1)
+            _, br, _, _ = measure(client, path, "br, gzip", 1)
+            wire = min(gz, br)
+            line = f"{path:34} {status:>6} {raw:>8} {gz:>8} {br:>8} {str(not_mod):>6} {t_raw * 1000:>7.2f}"
+            line += "".join(f" {wire / bps:>7.2f}" for bps in LINKS.values())
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from models import db, Transaction, Bill, Customer, RateChart, MilkType
 from utils import week_range_for_date, datetime_start_of, datetime_end_of
+from statements import get_statement
 from datetime import date, datetime
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
@@ -68,18 +69,8 @@ def bill_detail(bill_id):
     if current_user.role == "customer" and current_user.customer_id != bill.customer_id:
         flash("Not authorized", "error")
         return redirect(url_for("dashboard"))
-    txns = Transaction.query.filter(Transaction.customer_id == bill.customer_id,
-                                    Transaction.date_time >= datetime_start_of(bill.week_start),
-                                    Transaction.date_time <= datetime_end_of(bill.week_end)
-                                    ).order_by(Transaction.date_time).all()
-    # aggregate daily breakdown
-    daily = {}
-    for t in txns:
-        day = t.date_time.date()
-        daily.setdefault(day, []).append(t)
-    # sorted days
-    days = sorted(daily.items(), key=lambda x: x[0])
-    return render_template("bill_detail.html", bill=bill, days=days)
+    statement = get_statement(bill.customer_id, bill.week_start, bill.week_end)
+    return render_template("bill_detail.html", bill=bill, days=statement.days)
 
 @billing.route("/bill/<int:bill_id>/pdf")
 @login_required
@@ -89,11 +80,7 @@ def bill_pdf(bill_id):
         flash("Not authorized", "error")
         return redirect(url_for("dashboard"))
 
-    txns = Transaction.query.filter(
-        Transaction.customer_id == bill.customer_id,
-        Transaction.date_time >= datetime_start_of(bill.week_start),
-        Transaction.date_time <= datetime_end_of(bill.week_end)
-    ).order_by(Transaction.date_time).all()
+    statement = get_statement(bill.customer_id, bill.week_start, bill.week_end)
 
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
@@ -135,8 +122,9 @@ def bill_pdf(bill_id):
     y -= 10 * mm
 
     # Table header
-    col_headers = ["Date", "Session", "Milk", "Qty(L)", "Fat", "Rate", "Amount"]
-    col_widths = [0.18, 0.12, 0.18, 0.10, 0.08, 0.12, 0.22]  # relative proportions
+    # one line per day/session/milk bucket; with several entries fat and rate are averages
+    col_headers = ["Date", "Session", "Milk", "Entries", "Qty(L)", "Avg Fat", "Avg Rate", "Amount"]
+    col_widths = [0.15, 0.11, 0.14, 0.08, 0.11, 0.11, 0.12, 0.18]  # relative proportions
     col_positions = [margin]
     for w in col_widths:
         col_positions.append(col_positions[-1] + w * usable_width)
@@ -153,9 +141,8 @@ def bill_pdf(bill_id):
 
     # Rows
     c.setFont("Helvetica", 9)
-    total = 0
     row_alt = False
-    for t in txns:
+    for t in statement.rows:
         if y < margin + 40:  # New page if needed
             c.showPage()
             y = height - margin
@@ -166,9 +153,10 @@ def bill_pdf(bill_id):
         c.setFillColorRGB(0, 0, 0)
 
         values = [
-            t.date_time.strftime("%d-%m-%Y"),
+            t.day.strftime("%d-%m-%Y"),
             t.session,
-            t.milk_type.name if t.milk_type else "",
+            t.milk_type_name,
+            str(t.txn_count),
             f"{t.qty_liters:.2f}",
             str(t.fat_value or "-"),
             f"{t.rate_applied:.2f}",
@@ -180,7 +168,6 @@ def bill_pdf(bill_id):
             else:
                 c.drawString(col_positions[i] + 2, y, v)
         y -= 12
-        total += t.total_amount
         row_alt = not row_alt
 
     # Total line
@@ -190,7 +177,7 @@ def bill_pdf(bill_id):
     y -= 12
     c.setFont("Helvetica-Bold", 11)
     c.setFillColorRGB(0.1, 0.3, 0.6)
-    c.drawRightString(width - margin, y, f"Total: ₹{total:.2f}")
+    c.drawRightString(width - margin, y, f"Total: ₹{statement.total_amount:.2f}")
 
     # Footer
     y = margin
@@ -225,28 +212,15 @@ def generate_inline_bill():
             return redirect(url_for("generate_inline_bill"))
         start = datetime.strptime(s, "%Y-%m-%d").date()
         end = datetime.strptime(e, "%Y-%m-%d").date()
-        txns = Transaction.query.filter(
-            Transaction.customer_id == cid,
-            Transaction.date_time >= datetime_start_of(start),
-            Transaction.date_time <= datetime_end_of(end)
-        ).order_by(Transaction.date_time).all()
-        total = sum(t.total_amount for t in txns)
+        statement = get_statement(cid, start, end)
         # show summary & option to save as Bill
         return render_template("bill_detail.html",
                                bill=None,
-                               days=group_transactions_by_day(txns),
-                               inline_total=total,
+                               days=statement.days,
+                               inline_total=statement.total_amount,
                                start=start, end=end, cust=Customer.query.get(cid))
     return render_template("generate_bill.html", customers=customers)
 
-def group_transactions_by_day(txns):
-    daily = {}
-    for t in txns:
-        day = t.date_time.date()
-        daily.setdefault(day, []).append(t)
-    return sorted(daily.items(), key=lambda x: x[0])
-
-
 @billing.route("/customer/portal")
 @login_required
 def customer_portal():
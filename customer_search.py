@@ -0,0 +1,130 @@
+# customer_search.py
+import hashlib
+import re
+from sqlalchemy import event, or_, text
+from sqlalchemy.exc import OperationalError
+from models import db, Customer
+
+# None until ensure_customer_index() runs; False when SQLite lacks FTS5
+_fts_available = None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _phone_terms(phone):
+    # raw phone plus digit-only forms so "98765 43210", "9876543210" and "+91..." all match
+    if not phone:
+        return ""
+    digits = re.sub(r"\D", "", phone)
+    return " ".join(p for p in (phone, digits, digits[-10:]) if p)
+
+
+def _index_row(cust_id, name, phone):
+    return {"id": cust_id, "name": name or "", "phone": _phone_terms(phone), "ident": str(cust_id)}
+
+
+def _fts5_supported(conn):
+    # probe in the temp schema: needs no lock on the shared database file
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)"))
+    except OperationalError as e:
+        if "no such module" in str(e):
+            return False
+        raise
+    conn.execute(text("DROP TABLE temp.fts5_probe"))
+    return True
+
+
+def _fingerprint(rows):
+    h = hashlib.sha1()
+    for r in rows:
+        h.update(repr(tuple(r)).encode())
+    return h.hexdigest()
+
+
+def ensure_customer_index():
+    """Create the FTS5 index if needed and rebuild it when customer has changed under it."""
+    global _fts_available
+    with db.engine.connect() as conn:
+        _fts_available = _fts5_supported(conn)
+    if not _fts_available:
+        # SQLite built without FTS5: search falls back to LIKE
+        return False
+    # lock errors propagate: a worker must not start with the index silently disabled
+    with db.engine.begin() as conn:
+        # first write takes the database write lock, so workers starting together
+        # run this one at a time and only the first of them rebuilds
+        conn.execute(text("CREATE TABLE IF NOT EXISTS customer_fts_state "
+                          "(id INTEGER PRIMARY KEY, fingerprint TEXT NOT NULL)"))
+        conn.execute(text("INSERT OR IGNORE INTO customer_fts_state(id, fingerprint) VALUES (1, '')"))
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master "
+                                   "WHERE type = 'table' AND name = 'customer_fts'")).first()
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts "
+            "USING fts5(name, phone, ident, prefix='1 2 3')"))
+        customers = conn.execute(text("SELECT id, name, phone FROM customer ORDER BY id")).all()
+        # a fingerprint of every row, not a count or max id, so out-of-band edits and
+        # restores are caught; writes through the app keep the index current themselves
+        fingerprint = _fingerprint(customers)
+        stored = conn.execute(text("SELECT fingerprint FROM customer_fts_state WHERE id = 1")).scalar()
+        if exists and stored == fingerprint:
+            return True
+        conn.execute(text("DELETE FROM customer_fts"))
+        rows = [_index_row(*r) for r in customers]
+        if rows:
+            conn.execute(text("INSERT INTO customer_fts(rowid, name, phone, ident) "
+                              "VALUES (:id, :name, :phone, :ident)"), rows)
+        conn.execute(text("UPDATE customer_fts_state SET fingerprint = :fp WHERE id = 1"),
+                      {"fp": fingerprint})
+    return True
+
+
+def _match_query(q):
+    tokens = _TOKEN_RE.findall(q)
+    # every token must prefix-match some column; quoting keeps FTS syntax out of user input
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def search_customers(q, limit=20):
+    """Type-ahead matches on name, phone or customer ID as a list of dicts."""
+    q = (q or "").strip()
+    if not q:
+        return []
+    if _fts_available:
+        match = _match_query(q)
+        if not match:
+            return []
+        rows = db.session.execute(text(
+            "SELECT c.id, c.name, c.phone FROM customer_fts f "
+            "JOIN customer c ON c.id = f.rowid "
+            "WHERE customer_fts MATCH :match "
+            "ORDER BY f.rank, c.name LIMIT :limit"), {"match": match, "limit": limit}).all()
+    else:
+        like = f"%{q}%"
+        conds = [Customer.name.ilike(like), Customer.phone.ilike(like)]
+        if q.isdigit():
+            conds.append(Customer.id == int(q))
+        rows = (db.session.query(Customer.id, Customer.name, Customer.phone)
+                .filter(or_(*conds))
+                .order_by(Customer.name)
+                .limit(limit)
+                .all())
+    return [{"id": r[0], "name": r[1], "phone": r[2] or ""} for r in rows]
+
+
+# keep the index in the same transaction as the customer write
+@event.listens_for(Customer, "after_insert")
+@event.listens_for(Customer, "after_update")
+def _customer_written(mapper, connection, target):
+    if _fts_available:
+        # replace, so a row left behind by a reused id can never block the insert
+        connection.execute(text("DELETE FROM customer_fts WHERE rowid = :id"), {"id": target.id})
+        connection.execute(text("INSERT INTO customer_fts(rowid, name, phone, ident) "
+                                "VALUES (:id, :name, :phone, :ident)"),
+                           _index_row(target.id, target.name, target.phone))
+
+
+@event.listens_for(Customer, "after_delete")
+def _customer_deleted(mapper, connection, target):
+    if _fts_available:
+        connection.execute(text("DELETE FROM customer_fts WHERE rowid = :id"), {"id": target.id})
@@ -0,0 +1,175 @@
+# http_cache.py
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from flask import request, send_from_directory, url_for
+from flask.globals import request_ctx
+
+try:
+    import brotli   # optional; gzip is used when it is not installed
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "application/manifest+json", "image/svg+xml",
+}
+
+# a year; safe because static URLs carry a content hash (?v=...)
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+STATIC_MAX_AGE = 3600
+
+# precached by the service worker, by versioned URL
+SERVICE_WORKER_ASSETS = ["css/app.css", "css/base.css", "js/pwa.js", "manifest.webmanifest"]
+
+_static_versions = {}       # filename -> (mtime, short content hash)
+_compressed_static = OrderedDict()   # (path, etag, encoding) -> bytes
+_COMPRESSED_STATIC_SIZE = 64
+
+
+def static_version(static_folder, filename):
+    # short content hash for cache busting; recomputed only when the file changes
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_versions.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+    _static_versions[filename] = (mtime, digest)
+    return digest
+
+
+def _pick_encoding(accept_encoding):
+    accepted = {e.split(";")[0].strip() for e in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level + 2, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _matching_etag(etag):
+    # a compressed variant's etag is the identity etag plus an encoding suffix;
+    # returns the tag the client holds so the 304 echoes it back
+    if request.if_none_match.star_tag:
+        return etag
+    for candidate in request.if_none_match.as_set(include_weak=True):
+        if candidate == etag or candidate.startswith(etag + "-"):
+            return candidate
+    return None
+
+
+def init_http_cache(app):
+    """Compression, strong ETags, 304s and Cache-Control for every response."""
+    app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            v = static_version(app.static_folder, values["filename"])
+            if v:
+                values["v"] = v
+
+    @app.route("/service-worker.js")
+    def service_worker():
+        # served from the root so its scope covers every page, never cached itself.
+        # the worker's cache name embeds the asset versions, so any asset change
+        # changes these bytes and the browser installs a fresh worker.
+        response = send_from_directory(app.static_folder, "service-worker.js",
+                                       mimetype="application/javascript", max_age=0)
+        response.direct_passthrough = False
+        assets = [url_for("static", filename=a) for a in SERVICE_WORKER_ASSETS]
+        version = hashlib.sha1("".join(assets).encode()).hexdigest()[:10]
+        body = (response.get_data(as_text=True)
+                .replace("__SW_VERSION__", version)
+                .replace("__SW_ASSETS__", json.dumps(assets)))
+        response.set_data(body)
+        response.headers["Service-Worker-Allowed"] = "/"
+        return response
+
+    @app.after_request
+    def finalize_response(response):
+        if request.method not in ("GET", "HEAD") or response.status_code != 200:
+            return response
+        if "Content-Encoding" in response.headers:
+            return response
+
+        is_static = request.endpoint == "static"
+        if is_static:
+            if request.args.get("v"):
+                response.headers["Cache-Control"] = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+            else:
+                response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        elif request.endpoint == "service_worker":
+            response.headers["Cache-Control"] = "no-cache"
+        elif response.mimetype in ("text/html", "application/json"):
+            if request_ctx.flashes:
+                # get_flashed_messages() ran on this request: the body carries a flash banner,
+                # whether it was pending from a redirect or flashed by the view itself
+                response.headers["Cache-Control"] = "private, no-store"
+            else:
+                # pages are per-user: browsers keep them but must revalidate, which is a cheap 304
+                response.headers["Cache-Control"] = "private, no-cache"
+        else:
+            return response
+
+        compressible = response.mimetype in COMPRESSIBLE_MIMETYPES
+        if not compressible and not is_static:
+            return response
+
+        if response.direct_passthrough:
+            # static files stream from disk; buffer them so they can be compressed
+            if not compressible:
+                return response
+            response.direct_passthrough = False
+        data = response.get_data()
+
+        if is_static:
+            etag = response.get_etag()[0]
+        else:
+            etag = hashlib.sha1(data).hexdigest()
+            response.set_etag(etag)
+        if compressible:
+            response.vary.add("Accept-Encoding")
+        matched = _matching_etag(etag) if etag else None
+        if matched:
+            response.status_code = 304
+            response.set_data(b"")
+            response.set_etag(matched)
+            for header in ("Content-Length", "Content-Type"):
+                response.headers.pop(header, None)
+            return response
+
+        encoding = _pick_encoding(request.headers.get("Accept-Encoding", ""))
+        if not compressible or encoding is None or len(data) < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        key = (request.path, etag, encoding)
+        compressed = _compressed_static.get(key) if is_static else None
+        if compressed is None:
+            compressed = _compress(data, encoding, app.config["COMPRESS_LEVEL"])
+            if is_static:
+                _compressed_static[key] = compressed
+                while len(_compressed_static) > _COMPRESSED_STATIC_SIZE:
+                    _compressed_static.popitem(last=False)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        response.headers.pop("Accept-Ranges", None)
+        if etag:
+            response.set_etag(f"{etag}-{encoding}")
+        return response
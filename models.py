@@ -38,6 +38,29 @@ class RateChart(db.Model):
     rate = db.Column(db.Float, nullable=False)
     milk_type = db.relationship("MilkType", backref="rate_chart")
 
+class RateChartVersion(db.Model):
+    # an immutable, effective-dated snapshot of a milk type's rate chart.
+    # revising rates means publishing a new version, never editing an old one,
+    # so the rate applied on any past date can always be reconstructed.
+    __tablename__ = "rate_chart_version"
+    id = db.Column(db.Integer, primary_key=True)
+    milk_type_id = db.Column(db.Integer, db.ForeignKey("milk_type.id"), nullable=False)
+    effective_from = db.Column(db.Date, nullable=False)   # IST business date
+    note = db.Column(db.String(250))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    milk_type = db.relationship("MilkType", backref="rate_versions")
+    entries = db.relationship("RateChartEntry", backref="version",
+                              order_by="(RateChartEntry.snf_value, RateChartEntry.fat_value)",
+                              cascade="all, delete-orphan")
+
+class RateChartEntry(db.Model):
+    __tablename__ = "rate_chart_entry"
+    id = db.Column(db.Integer, primary_key=True)
+    version_id = db.Column(db.Integer, db.ForeignKey("rate_chart_version.id"), nullable=False)
+    fat_value = db.Column(db.Float, nullable=False)   # fractional steps allowed, e.g. 4.5
+    snf_value = db.Column(db.Float, nullable=True)    # null -> fat-only curve
+    rate = db.Column(db.Float, nullable=False)
+
 class Transaction(db.Model):
     __tablename__ = "transaction"
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,194 @@
+# rates.py
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from models import db, MilkType, RateChart, RateChartVersion, RateChartEntry
+from utils import IST
+
+# compiled lookup tables for published versions, keyed by version id.
+# versions are never edited after publishing, so these never go stale.
+_compiled_versions = {}
+
+
+def _interpolate(xs, ys, x):
+    # exact hit or linear interpolation between neighbours; None outside the chart
+    i = bisect_left(xs, x)
+    if i < len(xs) and xs[i] == x:
+        return ys[i]
+    if i == 0 or i == len(xs):
+        return None
+    x0, x1 = xs[i - 1], xs[i]
+    y0, y1 = ys[i - 1], ys[i]
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+class CompiledChart:
+    """Sorted fat/rate arrays for one chart version, one curve per SNF level."""
+
+    def __init__(self, points):
+        # points: iterable of (fat_value, snf_value, rate); snf_value may be None
+        grouped = {}
+        for fat, snf, rate in points:
+            key = float(snf) if snf is not None else None
+            grouped.setdefault(key, []).append((float(fat), float(rate)))
+        self.curves = {}
+        for snf, pts in grouped.items():
+            pts.sort()
+            self.curves[snf] = ([p[0] for p in pts], [p[1] for p in pts])
+        self.snf_levels = sorted(k for k in self.curves if k is not None)
+
+    def _curve_rate(self, snf, fat):
+        fats, rates = self.curves[snf]
+        return _interpolate(fats, rates, fat)
+
+    def rate(self, fat_value, snf_value=None):
+        if fat_value is None:
+            return None
+        fat = float(fat_value)
+        if snf_value is None or not self.snf_levels:
+            if None in self.curves:
+                return self._curve_rate(None, fat)
+            return None
+        # bilinear: interpolate along fat on the two bracketing SNF curves, then across SNF
+        snf = float(snf_value)
+        levels = self.snf_levels
+        i = bisect_left(levels, snf)
+        if i < len(levels) and levels[i] == snf:
+            return self._curve_rate(snf, fat)
+        if i == 0 or i == len(levels):
+            return None
+        lo, hi = levels[i - 1], levels[i]
+        r_lo = self._curve_rate(lo, fat)
+        r_hi = self._curve_rate(hi, fat)
+        if r_lo is None or r_hi is None:
+            return None
+        return r_lo + (r_hi - r_lo) * (snf - lo) / (hi - lo)
+
+
+def _compiled_version(version_id):
+    chart = _compiled_versions.get(version_id)
+    if chart is None:
+        rows = (db.session.query(RateChartEntry.fat_value, RateChartEntry.snf_value, RateChartEntry.rate)
+                .filter(RateChartEntry.version_id == version_id)
+                .all())
+        chart = CompiledChart(rows)
+        _compiled_versions[version_id] = chart
+    return chart
+
+
+class RateEngine:
+    """Resolves rates against effective-dated chart versions.
+
+    Create one per request (or per batch job); version indexes and the legacy
+    chart are loaded once per milk type and reused for every lookup.
+    """
+
+    def __init__(self):
+        self._versions = {}   # milk_type_id -> (effective dates, version ids)
+        self._legacy = {}     # milk_type_id -> CompiledChart from the undated RateChart
+        self._defaults = {}   # milk_type_id -> MilkType.default_rate
+
+    def _version_index(self, milk_type_id):
+        idx = self._versions.get(milk_type_id)
+        if idx is None:
+            rows = (db.session.query(RateChartVersion.effective_from, RateChartVersion.id)
+                    .filter(RateChartVersion.milk_type_id == milk_type_id)
+                    .order_by(RateChartVersion.effective_from, RateChartVersion.id)
+                    .all())
+            idx = ([r[0] for r in rows], [r[1] for r in rows])
+            self._versions[milk_type_id] = idx
+        return idx
+
+    def _legacy_chart(self, milk_type_id):
+        chart = self._legacy.get(milk_type_id)
+        if chart is None:
+            rows = (db.session.query(RateChart.fat_value, RateChart.rate)
+                    .filter(RateChart.milk_type_id == milk_type_id)
+                    .all())
+            chart = CompiledChart((fat, None, rate) for fat, rate in rows)
+            self._legacy[milk_type_id] = chart
+        return chart
+
+    def default_rate(self, milk_type_id):
+        if milk_type_id not in self._defaults:
+            mt = MilkType.query.get(milk_type_id)
+            self._defaults[milk_type_id] = mt.default_rate if mt else 0.0
+        return self._defaults[milk_type_id]
+
+    def version_id_for(self, milk_type_id, on):
+        # latest version effective on or before `on`; same-day republishes: last one wins
+        dates, ids = self._version_index(milk_type_id)
+        i = bisect_right(dates, on) - 1
+        return ids[i] if i >= 0 else None
+
+    def chart_for(self, milk_type_id, on=None):
+        if on is None:
+            on = datetime.now(IST).date()
+        version_id = self.version_id_for(milk_type_id, on)
+        if version_id is None:
+            # nothing published yet for that date: fall back to the original chart
+            return self._legacy_chart(milk_type_id)
+        return _compiled_version(version_id)
+
+    def lookup(self, milk_type_id, fat_value, on=None, snf_value=None):
+        rate = self.chart_for(milk_type_id, on).rate(fat_value, snf_value)
+        if rate is None:
+            return self.default_rate(milk_type_id)
+        return round(rate, 2)
+
+    def rates_for(self, rows):
+        # rows: iterable of (milk_type_id, on_date, fat_value, snf_value).
+        # one pass; each (milk type, date) resolves its chart only once.
+        charts = {}
+        out = []
+        for milk_type_id, on, fat_value, snf_value in rows:
+            key = (milk_type_id, on)
+            chart = charts.get(key)
+            if chart is None:
+                chart = charts[key] = self.chart_for(milk_type_id, on)
+            rate = chart.rate(fat_value, snf_value)
+            out.append(self.default_rate(milk_type_id) if rate is None else round(rate, 2))
+        return out
+
+
+def lookup_rate(milk_type_id, fat_value, on=None, snf_value=None):
+    # rate chart in effect on `on` (IST date, default today), else MilkType.default_rate
+    return RateEngine().lookup(milk_type_id, fat_value, on=on, snf_value=snf_value)
+
+
+def publish_rate_version(milk_type_id, effective_from, entries, note=None):
+    """Add a new chart version to the session; the caller commits.
+
+    entries: list of dicts with fat_value, rate and optional snf_value.
+    Raises ValueError on invalid input.
+    """
+    if not isinstance(entries, list):
+        raise ValueError("entries must be a list of rate entries.")
+    if not isinstance(effective_from, date):
+        raise ValueError("effective_from must be a date.")
+    if MilkType.query.get(milk_type_id) is None:
+        raise ValueError("Unknown milk type.")
+    seen = set()
+    parsed = []
+    for e in entries:
+        try:
+            fat = float(e.get("fat_value"))
+            rate = float(e.get("rate"))
+            snf_raw = e.get("snf_value")
+            snf = float(snf_raw) if snf_raw not in (None, "") else None
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("Each entry needs numeric fat_value and rate.")
+        if fat < 0 or rate < 0 or (snf is not None and snf < 0):
+            raise ValueError("Fat, SNF and rate must not be negative.")
+        if (fat, snf) in seen:
+            raise ValueError(f"Duplicate entry for fat {fat} / SNF {snf}.")
+        seen.add((fat, snf))
+        parsed.append(RateChartEntry(fat_value=fat, snf_value=snf, rate=rate))
+    if not parsed:
+        raise ValueError("At least one rate entry is required.")
+    if not any(e.snf_value is None for e in parsed):
+        # transactions carry no SNF reading, so they are always priced on the fat-only curve
+        raise ValueError("Include fat-only entries (no snf_value); transactions are priced on fat alone.")
+    version = RateChartVersion(milk_type_id=milk_type_id, effective_from=effective_from,
+                               note=note, entries=parsed)
+    db.session.add(version)
+    return version
@@ -0,0 +1,121 @@
+# repricing.py
+from sqlalchemy import func, update
+from models import db, Transaction, Bill
+from rates import RateEngine
+from statements import invalidate_statements
+from audit_log import stage_bulk_updates
+from utils import ist_date_of, utc_bounds_of_ist_range, datetime_start_of, datetime_end_of
+
+CHUNK_SIZE = 500
+
+
+def _transaction_chunks(lo, hi, milk_type_id, chunk_size):
+    # keyset pagination by id so memory stays flat on large ranges
+    last_id = 0
+    while True:
+        q = (db.session.query(Transaction.id, Transaction.customer_id, Transaction.milk_type_id,
+                              Transaction.date_time, Transaction.qty_liters, Transaction.fat_value,
+                              Transaction.rate_applied, Transaction.total_amount)
+             .filter(Transaction.date_time >= lo,
+                     Transaction.date_time < hi,
+                     Transaction.id > last_id))
+        if milk_type_id is not None:
+            q = q.filter(Transaction.milk_type_id == milk_type_id)
+        rows = q.order_by(Transaction.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _refresh_bills(customer_ids, start, end):
+    # recompute totals of bills overlapping [start, end], the same way billing generates them.
+    # start/end are UTC dates of the changed rows: bills are bounded on the stored UTC date,
+    # so an IST-morning transaction belongs to the bill ending the day before.
+    bills = Bill.query.filter(Bill.customer_id.in_(customer_ids),
+                              Bill.week_start <= end,
+                              Bill.week_end >= start).all()
+    refreshed = []
+    for b in bills:
+        total = (db.session.query(func.coalesce(func.sum(Transaction.total_amount), 0.0))
+                 .filter(Transaction.customer_id == b.customer_id,
+                         Transaction.date_time >= datetime_start_of(b.week_start),
+                         Transaction.date_time <= datetime_end_of(b.week_end))
+                 .scalar())
+        total = round(total, 2)
+        if total != b.total_amount:
+            refreshed.append({"bill_id": b.id, "customer_id": b.customer_id,
+                              "old_total": b.total_amount, "new_total": total})
+            b.total_amount = total
+    return refreshed
+
+
+def reprice_transactions(start, end, milk_type_id=None, dry_run=True, chunk_size=CHUNK_SIZE):
+    """Re-apply the rate chart in effect on each transaction's IST date.
+
+    Rates are resolved in chunks with one RateEngine pass per chunk and written
+    back with a single executemany UPDATE per chunk. Overlapping bills are then
+    refreshed. With dry_run the whole unit of work is rolled back, so the report
+    shows exactly what would change. Returns a report dict.
+    """
+    if end < start:
+        raise ValueError("End date is before start date.")
+    lo, hi = utc_bounds_of_ist_range(start, end)
+    engine = RateEngine()
+    customers = {}
+    scanned = changed = 0
+    changed_from = changed_to = None   # UTC dates spanned by the changed rows
+
+    try:
+        for rows in _transaction_chunks(lo, hi, milk_type_id, chunk_size):
+            new_rates = engine.rates_for(
+                (r.milk_type_id, ist_date_of(r.date_time), r.fat_value, None) for r in rows)
+            updates = []
+            for r, rate in zip(rows, new_rates):
+                total = round(r.qty_liters * rate, 2)
+                if rate == r.rate_applied and total == r.total_amount:
+                    continue
+                updates.append({"id": r.id, "rate_applied": rate, "total_amount": total})
+                day = r.date_time.date()
+                changed_from = day if changed_from is None else min(changed_from, day)
+                changed_to = day if changed_to is None else max(changed_to, day)
+                c = customers.setdefault(r.customer_id, {"customer_id": r.customer_id, "transactions": 0,
+                                                         "old_total": 0.0, "new_total": 0.0})
+                c["transactions"] += 1
+                c["old_total"] += r.total_amount
+                c["new_total"] += total
+            if updates:
+                db.session.execute(update(Transaction), updates)
+                stage_bulk_updates(db.session, Transaction.__tablename__, updates)
+            scanned += len(rows)
+            changed += len(updates)
+
+        for c in customers.values():
+            c["old_total"] = round(c["old_total"], 2)
+            c["new_total"] = round(c["new_total"], 2)
+            c["delta"] = round(c["new_total"] - c["old_total"], 2)
+
+        bills = _refresh_bills(list(customers), changed_from, changed_to) if customers else []
+
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+            # bulk UPDATEs skip mapper events, so drop memoized statements explicitly
+            for customer_id in customers:
+                invalidate_statements(customer_id)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "milk_type_id": milk_type_id,
+        "dry_run": dry_run,
+        "scanned": scanned,
+        "changed": changed,
+        "total_delta": round(sum(c["delta"] for c in customers.values()), 2),
+        "customers": sorted(customers.values(), key=lambda c: c["customer_id"]),
+        "bills": bills,
+    }
@@ -0,0 +1,126 @@
+# statements.py
+import itertools
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from sqlalchemy import case, event, func
+from sqlalchemy.orm import Session
+from models import db, Transaction, MilkType
+from utils import datetime_start_of, datetime_end_of
+
+# one bucket per (day, session, milk type, txn type); usually a single transaction
+StatementRow = namedtuple("StatementRow", [
+    "day", "session", "milk_type_name", "txn_type", "qty_liters",
+    "fat_value", "rate_applied", "total_amount", "txn_count",
+])
+
+CACHE_SIZE = 256
+# memo is per process; the TTL bounds staleness from writes made by other workers
+CACHE_TTL_SECONDS = 60
+
+_cache = OrderedDict()   # (customer_id, start, end) -> (stored_at, Statement)
+_cache_lock = Lock()
+
+
+class Statement:
+    """Day-bucketed transactions of one customer over a date range."""
+
+    def __init__(self, customer_id, start, end, rows):
+        self.customer_id = customer_id
+        self.start = start
+        self.end = end
+        self.rows = rows
+        days = OrderedDict()
+        for r in rows:
+            days.setdefault(r.day, []).append(r)
+        self.days = list(days.items())   # [(day, [StatementRow, ...]), ...] in day order
+        self.total_liters = round(sum(r.qty_liters for r in rows), 2)
+        self.total_amount = round(sum(r.total_amount for r in rows), 2)
+
+
+def _query_rows(customer_id, start, end):
+    # same bounds as bill generation so statement totals match Bill.total_amount
+    day = func.date(Transaction.date_time)
+    q = (db.session.query(day.label("day"),
+                          Transaction.session,
+                          MilkType.name,
+                          Transaction.txn_type,
+                          func.sum(Transaction.qty_liters),
+                          # fat weighted by quantity, over the deliveries that had a reading
+                          func.sum(Transaction.fat_value * Transaction.qty_liters),
+                          func.sum(case((Transaction.fat_value.isnot(None), Transaction.qty_liters))),
+                          func.sum(Transaction.total_amount),
+                          func.avg(Transaction.rate_applied),
+                          func.count(Transaction.id))
+         .join(MilkType, MilkType.id == Transaction.milk_type_id)
+         .filter(Transaction.customer_id == customer_id,
+                 Transaction.date_time >= datetime_start_of(start),
+                 Transaction.date_time <= datetime_end_of(end))
+         .group_by(day, Transaction.session, Transaction.milk_type_id, Transaction.txn_type)
+         .order_by(day, func.min(Transaction.date_time), func.min(Transaction.id)))
+    rows = []
+    for d, session, mt_name, txn_type, liters, fat_qty, fat_liters, amount, avg_rate, count in q.all():
+        # weighted fat and rate equal the recorded values whenever the bucket has one transaction
+        rate = amount / liters if liters else avg_rate
+        fat = fat_qty / fat_liters if fat_liters else None
+        rows.append(StatementRow(
+            day=datetime.strptime(d, "%Y-%m-%d").date(),
+            session=session,
+            milk_type_name=mt_name,
+            txn_type=txn_type,
+            qty_liters=liters,
+            fat_value=round(fat, 1) if fat is not None else None,
+            rate_applied=round(rate, 2),
+            total_amount=round(amount, 2),
+            txn_count=count,
+        ))
+    return rows
+
+
+def get_statement(customer_id, start, end):
+    key = (customer_id, start, end)
+    now = monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < CACHE_TTL_SECONDS:
+            _cache.move_to_end(key)
+            return hit[1]
+    statement = Statement(customer_id, start, end, _query_rows(customer_id, start, end))
+    with _cache_lock:
+        _cache[key] = (now, statement)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return statement
+
+
+def invalidate_statements(customer_id=None):
+    # drop memoized statements for one customer, or all of them
+    with _cache_lock:
+        if customer_id is None:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] == customer_id]:
+            del _cache[key]
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_customers(session, flush_context):
+    # flushed rows are not visible to other requests until commit; invalidating now
+    # would let a concurrent read re-cache the old rows, so wait for after_commit
+    touched = session.info.setdefault("statement_customers", set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Transaction):
+            touched.add(obj.customer_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for customer_id in session.info.pop("statement_customers", ()):
+        invalidate_statements(customer_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_customers(session):
+    session.info.pop("statement_customers", None)
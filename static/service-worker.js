@@ -1,13 +1,68 @@
-const CACHE="milk-diary-v1";
-const ASSETS=[
-  "/",
-  "/static/css/app.css",
-  "/static/js/pwa.js",
-  "/static/manifest.webmanifest"
-];
+// served through /service-worker.js, which fills in VERSION (a hash of the
+// asset versions) and ASSETS (their versioned URLs). Every asset change
+// therefore ships a new worker, and old caches are dropped on activate.
+const VERSION = "__SW_VERSION__";
+const STATIC_CACHE = "milk-diary-static-" + VERSION;
+const PAGE_CACHE = "milk-diary-pages-" + VERSION;
+const ASSETS = __SW_ASSETS__;
+// read-only pages kept for offline use
+const READ_PAGES = ["/", "/transactions", "/bills", "/rate-chart", "/customers", "/customer/portal"];
+
+function isReadPage(url) {
+  if (READ_PAGES.includes(url.pathname)) return true;
+  return /^\/bill\/\d+$/.test(url.pathname);
+}
+
 self.addEventListener("install", e => {
-  e.waitUntil(caches.open(CACHE).then(c => c.addAll(ASSETS)));
+  e.waitUntil(caches.open(STATIC_CACHE).then(c => c.addAll(ASSETS)).then(() => self.skipWaiting()));
 });
+
+self.addEventListener("activate", e => {
+  e.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys
+        .filter(k => k.startsWith("milk-diary-") && k !== STATIC_CACHE && k !== PAGE_CACHE)
+        .map(k => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function networkFirst(request) {
+  // online the page is always fresh (e.g. right after saving a record);
+  // the cached copy is only used when the network is unavailable
+  return caches.open(PAGE_CACHE).then(cache =>
+    fetch(request).then(res => {
+      // only keep real pages: not login redirects, not pages showing one-off flash messages
+      const noStore = (res.headers.get("Cache-Control") || "").includes("no-store");
+      if (res.ok && !res.redirected && !noStore) cache.put(request, res.clone());
+      return res;
+    }).catch(err => cache.match(request).then(cached => {
+      if (cached) return cached;
+      throw err;
+    }))
+  );
+}
+
 self.addEventListener("fetch", e => {
-  e.respondWith(caches.match(e.request).then(r => r || fetch(e.request)));
+  const req = e.request;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (url.pathname.startsWith("/auth/")) {
+    // pages are per-user: forget them whenever anyone logs in or out
+    e.waitUntil(caches.delete(PAGE_CACHE));
+    return;
+  }
+  if (req.method !== "GET") return;
+  if (url.pathname.startsWith("/static/")) {
+    // versioned URLs never change content, so the cache can answer first
+    e.respondWith(caches.match(req).then(r => r || fetch(req).then(res => {
+      if (res.ok) caches.open(STATIC_CACHE).then(c => c.put(req, res.clone()));
+      return res;
+    })));
+    return;
+  }
+  if (req.mode === "navigate" && isReadPage(url)) {
+    e.respondWith(networkFirst(req));
+  }
 });
@@ -1,5 +1,8 @@
 # utils.py
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta, datetime, timezone
+from zoneinfo import ZoneInfo
+
+IST = ZoneInfo("Asia/Kolkata")
 
 def week_range_for_date(d: date):
     start = d - timedelta(days=d.weekday())  # Monday
@@ -11,3 +14,14 @@ def datetime_start_of(d: date):
 
 def datetime_end_of(d: date):
     return datetime.combine(d, datetime.max.time())
+
+def ist_date_of(utc_naive: datetime):
+    # transactions are stored as UTC-naive; the business day is the IST date
+    return utc_naive.replace(tzinfo=timezone.utc).astimezone(IST).date()
+
+def utc_bounds_of_ist_range(start: date, end: date):
+    # [start 00:00 IST, end+1 00:00 IST) as UTC-naive datetimes, matching stored date_time
+    lo = datetime.combine(start, datetime.min.time()).replace(tzinfo=IST)
+    hi = datetime.combine(end + timedelta(days=1), datetime.min.time()).replace(tzinfo=IST)
+    return (lo.astimezone(timezone.utc).replace(tzinfo=None),
+            hi.astimezone(timezone.utc).replace(tzinfo=None))